@@ -10,12 +10,221 @@ import plotly.graph_objects as go
 import random
 from datetime import datetime, timedelta
 import time
+import os
+import io
+import json
+import sqlite3
+import hashlib
+import sys
+import functools
+import logging
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -----------------------------
+# Metrics & Instrumentation
+# -----------------------------
+METRICS_ENABLED = os.environ.get("AGENT_METRICS", "").lower() in ("1", "true", "yes")
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and latency histograms in Prometheus text format.
+
+    Each Streamlit worker process keeps its own registry; every exported
+    series carries a ``pid`` label so scrapes from several workers stay apart.
+    """
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    HELP = {
+        "app_reruns_total": "Streamlit script reruns",
+        "analysis_runs_total": "Multi-agent analysis runs",
+        "agent_calls_total": "Instrumented method calls",
+        "agent_call_errors_total": "Instrumented method calls that raised",
+        "agent_call_duration_seconds": "Instrumented method latency",
+        "dataframe_rows": "Rows held by tracked DataFrames",
+        "dataframe_bytes": "Deep memory usage of tracked DataFrames",
+        "result_store_entries": "Entries in the persistent result store",
+        "result_store_bytes": "Payload bytes in the persistent result store",
+        "result_store_hit_rate": "Persistent result store hit rate",
+        "scenario_delta_bytes": "Memory held by scenario view deltas",
+        "process_resident_memory_bytes": "Resident set size of the app process",
+        "process_max_resident_memory_bytes": "Peak resident set size of the app process"
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.const_labels = (("pid", os.getpid()),)
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+    
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items())) if labels else ()
+    
+    def inc(self, name, labels=None, value=1):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def counter(self, name, labels=None):
+        with self._lock:
+            return self.counters.get(self._key(name, labels), 0)
+    
+    def set_gauge(self, name, value, labels=None):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+    
+    def observe(self, name, seconds, labels=None):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"buckets": [0] * len(self.LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+            for idx, bound in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= bound:
+                    hist["buckets"][idx] += 1
+                    break
+            hist["sum"] += seconds
+            hist["count"] += 1
+    
+    def latency_summary(self):
+        """Per-method call counts and mean latency for the admin panel."""
+        with self._lock:
+            return [
+                dict(labels, calls=hist["count"], avg_ms=round(hist["sum"] / hist["count"] * 1000, 2))
+                for (name, labels), hist in sorted(self.histograms.items())
+                if name == "agent_call_duration_seconds" and hist["count"]
+            ]
+    
+    def _format_labels(self, labels, extra=()):
+        pairs = list(self.const_labels) + list(labels) + list(extra)
+        escaped = (
+            k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for k, v in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+    
+    def render(self):
+        lines = []
+        with self._lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({n for n, _ in series}):
+                    lines.append(f"# HELP {name} {self.HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (n, labels), value in sorted(series.items()):
+                        if n == name:
+                            lines.append(f"{name}{self._format_labels(labels)} {value}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# HELP {name} {self.HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), hist in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.LATENCY_BUCKETS, hist["buckets"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {hist['count']}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {hist['sum']}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+# The registry must outlive Streamlit reruns, which re-execute this module
+@st.cache_resource(show_spinner=False)
+def _metrics_registry():
+    return MetricsRegistry()
+
+METRICS = _metrics_registry() if METRICS_ENABLED else None
+
+def instrumented(func):
+    """Record call count and latency for ``func``; a no-op when metrics are disabled."""
+    if METRICS is None:
+        return func
+    component, _, method = func.__qualname__.rpartition(".")
+    labels = {"component": component, "method": method}
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            METRICS.inc("agent_call_errors_total", labels)
+            raise
+        finally:
+            METRICS.observe("agent_call_duration_seconds", time.perf_counter() - start, labels)
+            METRICS.inc("agent_calls_total", labels)
+    return wrapper
+
+def process_rss_bytes():
+    """Current resident set size, or ``None`` where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def process_max_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is reported in KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+@st.cache_resource(show_spinner=False)
+def _start_metrics_server(host, port):
+    """Serve the registry as a Prometheus scrape target, once per process.
+
+    Returns ``None`` if the port cannot be bound (e.g. another worker holds
+    it) so the dashboard keeps running without the endpoint.
+    """
+    registry = METRICS
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as exc:
+        logging.getLogger(__name__).warning("Metrics endpoint not started on %s:%s: %s", host, port, exc)
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_metrics_file(path, text):
+    """Atomically write ``text``; a ``{pid}`` in ``path`` gives each worker its own file."""
+    path = path.replace("{pid}", str(os.getpid()))
+    # A unique temp file per write keeps concurrent sessions from racing
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 # -----------------------------
 # Enhanced Simulated Database
 # -----------------------------
 class ResearchDatabase:
-    def __init__(self):
+    @instrumented
+    def __init__(self, seed=None):
+        # A fixed seed makes the corpus (and its version) reproducible across restarts
+        self._rng = random.Random(seed)
         self.universities = [
             {"name": "KAUST", "country": "Saudi Arabia", "ranking": 1},
             {"name": "MBZUAI", "country": "UAE", "ranking": 2},
@@ -46,16 +255,25 @@ class ResearchDatabase:
         
         self.papers = self._generate_papers()
         self.collaborations = self._generate_collaborations()
+        self._version = None
+    
+    @property
+    def version(self):
+        """Content hash of the papers table, used to key cached results."""
+        if self._version is None:
+            row_hashes = pd.util.hash_pandas_object(self.papers, index=True).values
+            self._version = hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+        return self._version
     
     def _generate_papers(self):
         papers = []
         for i in range(500):
-            uni = random.choice(self.universities)
-            topic = random.choice(self.topics)
-            year = random.choice([2022, 2023, 2024])
+            uni = self._rng.choice(self.universities)
+            topic = self._rng.choice(self.topics)
+            year = self._rng.choice([2022, 2023, 2024])
             
             # More realistic citation distribution
-            base_citations = random.randint(5, 150)
+            base_citations = self._rng.randint(5, 150)
             if year == 2022:
                 base_citations = int(base_citations * 1.5)  # Older papers have more citations
             elif year == 2024:
@@ -68,12 +286,12 @@ class ResearchDatabase:
                 "country": uni['country'],
                 "topic": topic['name'],
                 "year": year,
-                "month": random.randint(1, 12),
+                "month": self._rng.randint(1, 12),
                 "citations": base_citations,
-                "authors": random.randint(2, 8),
-                "conference": random.choice(self.conferences),
-                "open_access": random.choice([True, False]),
-                "h_index_contribution": random.randint(1, 5)
+                "authors": self._rng.randint(2, 8),
+                "conference": self._rng.choice(self.conferences),
+                "open_access": self._rng.choice([True, False]),
+                "h_index_contribution": self._rng.randint(1, 5)
             })
         return pd.DataFrame(papers)
     
@@ -81,15 +299,383 @@ class ResearchDatabase:
         collabs = []
         unis = [u['name'] for u in self.universities]
         for _ in range(50):
-            uni1, uni2 = random.sample(unis, 2)
+            uni1, uni2 = self._rng.sample(unis, 2)
             collabs.append({
                 "uni1": uni1,
                 "uni2": uni2,
-                "papers": random.randint(3, 15),
-                "citations": random.randint(50, 300)
+                "papers": self._rng.randint(3, 15),
+                "citations": self._rng.randint(50, 300)
             })
         return pd.DataFrame(collabs)
 
+# -----------------------------
+# Scenario Datasets & Copy-on-Write Views
+# -----------------------------
+def query_mask(papers, universities, topics, year_range, min_citations):
+    return (
+        (papers['university'].isin(universities)) &
+        (papers['topic'].isin(topics)) &
+        (papers['year'] >= year_range[0]) &
+        (papers['year'] <= year_range[1]) &
+        (papers['citations'] >= min_citations)
+    )
+
+class ScenarioView:
+    """Copy-on-write view over a base ResearchDatabase.
+
+    Only overridden cells, added papers and dropped row labels are stored,
+    so memory grows with the size of the delta rather than the corpus.
+    """
+
+    def __init__(self, name, base):
+        self.name = name
+        self.base = base
+        self.overrides = {}  # column -> Series of new values keyed by base row label
+        self.added = base.papers.iloc[0:0].copy()
+        self.dropped = pd.Index([], dtype=base.papers.index.dtype)
+    
+    # Reference data is shared with the base corpus
+    @property
+    def universities(self):
+        return self.base.universities
+    
+    @property
+    def topics(self):
+        return self.base.topics
+    
+    @property
+    def conferences(self):
+        return self.base.conferences
+    
+    @property
+    def collaborations(self):
+        return self.base.collaborations
+    
+    def _labels(self, rows):
+        """Resolve a boolean mask or row labels into (base labels, added labels)."""
+        if isinstance(rows, pd.Series) and rows.dtype == bool:
+            labels = rows.index[rows.values]
+        else:
+            labels = pd.Index(rows)
+        in_base = labels.isin(self.base.papers.index)
+        in_added = labels.isin(self.added.index)
+        unknown = labels[~in_base & ~in_added]
+        if len(unknown):
+            raise ValueError(f"Scenario '{self.name}' has no papers with labels {list(unknown[:5])}")
+        return labels[in_base], labels[in_added]
+    
+    def set_values(self, rows, column, values):
+        """Override ``column`` for the given rows (boolean mask or labels).
+
+        Base rows are recorded as overrides; rows the view added itself are
+        edited in place since they are already part of the delta.
+        """
+        base_labels, added_labels = self._labels(rows)
+        new = pd.Series(values, index=base_labels.append(added_labels),
+                        dtype=self.base.papers[column].dtype)
+        if len(added_labels):
+            self.added.loc[added_labels, column] = new.loc[added_labels].values
+        if len(base_labels):
+            new = new.loc[base_labels]
+            if column in self.overrides:
+                new = pd.concat([self.overrides[column].drop(base_labels, errors='ignore'), new])
+            self.overrides[column] = new
+        return self
+    
+    def scale_column(self, rows, column, factor):
+        base_labels, added_labels = self._labels(rows)
+        current = pd.concat([
+            self.patch(self.base.papers.loc[base_labels, [column]])[column],
+            self.added.loc[added_labels, column]
+        ])
+        return self.set_values(current.index, column, (current * factor).round().astype(current.dtype))
+    
+    def add_papers(self, papers):
+        papers = papers.copy()
+        start = max(self.base.papers.index.max(), self.added.index.max() if len(self.added) else -1) + 1
+        papers.index = pd.RangeIndex(start, start + len(papers))
+        self.added = pd.concat([self.added, papers[self.base.papers.columns]])
+        return self
+    
+    def drop_papers(self, rows):
+        base_labels, added_labels = self._labels(rows)
+        self.added = self.added.drop(added_labels)
+        self.dropped = self.dropped.union(base_labels)
+        return self
+    
+    def scale_output(self, university, factor):
+        """Simulate ``university`` publishing ``factor`` times as many papers."""
+        source = self.base.papers[self.base.papers['university'] == university]
+        extra = int(round(len(source) * (factor - 1)))
+        if extra < 0:
+            return self.drop_papers(source.index[:-extra])
+        if extra == 0:
+            return self
+        copies = source.sample(n=extra, replace=extra > len(source), random_state=0).copy()
+        offset = len(self.base.papers) + len(self.added)
+        copies['id'] = [f"S{offset + i + 1:04d}" for i in range(extra)]
+        return self.add_papers(copies)
+    
+    @property
+    def overridden(self):
+        labels = pd.Index([], dtype=self.base.papers.index.dtype)
+        for values in self.overrides.values():
+            labels = labels.union(values.index)
+        return labels.difference(self.dropped)
+    
+    def patch(self, frame):
+        """Apply the column overrides to a slice of the base papers."""
+        if not self.overrides:
+            return frame
+        frame = frame.copy()
+        for column, values in self.overrides.items():
+            if column in frame.columns:
+                hit = values.index.intersection(frame.index)
+                frame.loc[hit, column] = values.loc[hit]
+        return frame
+    
+    @instrumented
+    def filter(self, universities, topics, year_range, min_citations, base_mask=None):
+        """Run a query against the view, reusing a precomputed base mask if given."""
+        papers = self.base.papers
+        if base_mask is None:
+            base_mask = query_mask(papers, universities, topics, year_range, min_citations)
+        touched = self.overridden.union(self.dropped)
+        parts = [papers[base_mask & ~papers.index.isin(touched)]]
+        if len(self.overridden):
+            patched = self.patch(papers.loc[self.overridden])
+            parts.append(patched[query_mask(patched, universities, topics, year_range, min_citations)])
+        if len(self.added):
+            parts.append(self.added[query_mask(self.added, universities, topics, year_range, min_citations)])
+        if len(parts) == 1:
+            return parts[0]
+        return pd.concat(parts).sort_index()
+    
+    @property
+    def papers(self):
+        """Materialised papers table; this is a full copy, prefer ``filter``."""
+        papers = self.base.papers.drop(self.dropped)
+        return pd.concat([self.patch(papers), self.added])
+    
+    @property
+    def delta_bytes(self):
+        size = self.added.memory_usage(deep=True).sum() + self.dropped.nbytes
+        return int(size + sum(v.memory_usage(deep=True) for v in self.overrides.values()))
+    
+    @property
+    def version(self):
+        digest = hashlib.sha1(self.base.version.encode("utf-8"))
+        for column in sorted(self.overrides):
+            digest.update(column.encode("utf-8"))
+            digest.update(pd.util.hash_pandas_object(self.overrides[column]).values.tobytes())
+        digest.update(pd.util.hash_pandas_object(self.added).values.tobytes())
+        digest.update(self.dropped.values.tobytes())
+        return digest.hexdigest()[:16]
+
+class ScenarioCatalog:
+    """Named base datasets plus copy-on-write scenario views over them."""
+
+    def __init__(self, baseline):
+        self.datasets = {}
+        self.views = {}
+        self.add_dataset("Baseline", baseline)
+    
+    def add_dataset(self, name, db):
+        self.datasets[name] = db
+        self.views[name] = ScenarioView(name, db)
+        return self.views[name]
+    
+    def create_view(self, name, dataset="Baseline"):
+        self.views[name] = ScenarioView(name, self.datasets[dataset])
+        return self.views[name]
+    
+    def names(self):
+        return list(self.views)
+    
+    @instrumented
+    def filter_across(self, names, universities, topics, year_range, min_citations):
+        """Run one query over several scenarios, masking each base corpus once."""
+        base_masks = {}
+        results = {}
+        for name in names:
+            view = self.views[name]
+            key = id(view.base)
+            if key not in base_masks:
+                base_masks[key] = query_mask(view.base.papers, universities, topics, year_range, min_citations)
+            results[name] = view.filter(universities, topics, year_range, min_citations,
+                                        base_mask=base_masks[key])
+        return results
+
+# -----------------------------
+# Persistent Result Store
+# -----------------------------
+class ResultStore:
+    """SQLite-backed cache for agent results shared across reruns and workers.
+
+    Entries are keyed by a fingerprint of the query parameters plus the
+    database version, expire after ``ttl_seconds`` and are evicted least
+    recently used first once the store grows past ``max_bytes``. Values are
+    stored as JSON (DataFrames in pandas' table schema) rather than pickled,
+    so the shared file cannot carry executable payloads.
+    """
+
+    def __init__(self, path=None, ttl_seconds=24 * 3600, max_bytes=64 * 1024 * 1024):
+        self.path = path or os.environ.get("RESULT_STORE_PATH", "result_store.sqlite")
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # One connection is shared by every Streamlit session in the process
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    db_version TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS lookups (
+                    kind TEXT PRIMARY KEY,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0,
+                    lookup_ms REAL NOT NULL DEFAULT 0
+                )
+            """)
+    
+    @staticmethod
+    def fingerprint(kind, params, db_version):
+        blob = json.dumps({"kind": kind, "params": params, "db": db_version},
+                          sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _frame_to_doc(frame):
+        doc = {}
+        # The table schema cannot hold MultiIndex columns, so keep them alongside
+        if isinstance(frame.columns, pd.MultiIndex):
+            doc["columns"] = [list(column) for column in frame.columns]
+            doc["column_names"] = list(frame.columns.names)
+            frame = frame.set_axis([f"c{i}" for i in range(frame.shape[1])], axis=1)
+        doc["table"] = frame.to_json(orient="table")
+        return doc
+    
+    @staticmethod
+    def _frame_from_doc(doc):
+        frame = pd.read_json(io.StringIO(doc["table"]), orient="table")
+        if "columns" in doc:
+            frame.columns = pd.MultiIndex.from_tuples(
+                [tuple(column) for column in doc["columns"]], names=doc["column_names"]
+            )
+        return frame
+    
+    @classmethod
+    def _encode(cls, value):
+        """Serialise a string, a DataFrame or a tuple of DataFrames to JSON bytes."""
+        if isinstance(value, str):
+            doc = {"text": value}
+        elif isinstance(value, pd.DataFrame):
+            doc = {"frame": cls._frame_to_doc(value)}
+        else:
+            doc = {"frames": [cls._frame_to_doc(frame) for frame in value]}
+        return json.dumps(doc).encode("utf-8")
+    
+    @classmethod
+    def _decode(cls, payload):
+        doc = json.loads(payload.decode("utf-8"))
+        if "text" in doc:
+            return doc["text"]
+        if "frame" in doc:
+            return cls._frame_from_doc(doc["frame"])
+        return tuple(cls._frame_from_doc(frame) for frame in doc["frames"])
+    
+    @instrumented
+    def get(self, kind, params, db_version):
+        """Return the cached value or ``None`` and record the lookup."""
+        start = time.perf_counter()
+        key = self.fingerprint(kind, params, db_version)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            value = None
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                value = self._decode(row[0])
+                self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            elif row is not None:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._conn.execute("""
+                INSERT INTO lookups (kind, hits, misses, lookup_ms) VALUES (?, ?, ?, ?)
+                ON CONFLICT(kind) DO UPDATE SET
+                    hits = hits + excluded.hits,
+                    misses = misses + excluded.misses,
+                    lookup_ms = lookup_ms + excluded.lookup_ms
+            """, (kind, int(value is not None), int(value is None), elapsed_ms))
+        return value
+    
+    @instrumented
+    def put(self, kind, params, db_version, value):
+        key = self.fingerprint(kind, params, db_version)
+        payload = self._encode(value)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, db_version, payload, len(payload), now, now)
+            )
+            self._evict(now)
+    
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM results ORDER BY last_access ASC"
+        ).fetchall():
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+    
+    def stats(self):
+        """Hit rate and mean lookup latency, overall and per result kind."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT kind, hits, misses, lookup_ms FROM lookups ORDER BY kind"
+            ).fetchall()
+        per_kind = {}
+        for kind, hits, misses, lookup_ms in rows:
+            lookups = hits + misses
+            per_kind[kind] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "avg_lookup_ms": lookup_ms / lookups if lookups else 0.0
+            }
+        hits = sum(k["hits"] for k in per_kind.values())
+        lookups = hits + sum(k["misses"] for k in per_kind.values())
+        total_ms = sum(k["avg_lookup_ms"] * (k["hits"] + k["misses"]) for k in per_kind.values())
+        return {
+            "entries": entries,
+            "size_bytes": size,
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "avg_lookup_ms": total_ms / lookups if lookups else 0.0,
+            "per_kind": per_kind
+        }
+
 # -----------------------------
 # Enhanced Agents with Progress Tracking
 # -----------------------------
@@ -98,20 +684,29 @@ class SearchAgent:
         self.name = "🔍 Publication Search Agent"
         self.status = "idle"
     
+    @instrumented
     def filter_papers(self, db, universities, topics, year_range, min_citations):
         self.status = "working"
         time.sleep(0.3)  # Simulate processing
         
-        df = db.papers[
-            (db.papers['university'].isin(universities)) &
-            (db.papers['topic'].isin(topics)) &
-            (db.papers['year'] >= year_range[0]) &
-            (db.papers['year'] <= year_range[1]) &
-            (db.papers['citations'] >= min_citations)
-        ]
+        df = db.papers[query_mask(db.papers, universities, topics, year_range, min_citations)]
         
         self.status = "completed"
-        return df, {
+        return df, self._summarize(df)
+    
+    @instrumented
+    def filter_papers_across(self, catalog, scenarios, universities, topics, year_range, min_citations):
+        self.status = "working"
+        time.sleep(0.3)
+        
+        results = catalog.filter_across(scenarios, universities, topics, year_range, min_citations)
+        
+        self.status = "completed"
+        return results, {name: self._summarize(df) for name, df in results.items()}
+    
+    @staticmethod
+    def _summarize(df):
+        return {
             "papers_found": len(df),
             "total_citations": df['citations'].sum(),
             "avg_citations": df['citations'].mean() if not df.empty else 0
@@ -122,6 +717,7 @@ class AnalysisAgent:
         self.name = "📊 Topic Modeling Agent"
         self.status = "idle"
     
+    @instrumented
     def compute_advanced_stats(self, papers):
         self.status = "working"
         time.sleep(0.4)
@@ -153,12 +749,39 @@ class AnalysisAgent:
         
         self.status = "completed"
         return uni_stats, topic_stats, yearly_trends, country_stats
+    
+    @instrumented
+    def compare_scenarios(self, papers_by_scenario):
+        """Side-by-side university and topic stats, one column per scenario."""
+        self.status = "working"
+        time.sleep(0.2)
+        
+        scenarios = list(papers_by_scenario)
+        combined = pd.concat(papers_by_scenario, names=['scenario', None])
+        
+        comparisons = []
+        for key in ['university', 'topic']:
+            stats = combined.groupby(['scenario', key]).agg(
+                total_citations=('citations', 'sum'),
+                avg_citations=('citations', 'mean'),
+                paper_count=('citations', 'count')
+            ).round(2)
+            columns = pd.MultiIndex.from_product([stats.columns, scenarios], names=[None, 'scenario'])
+            stats = stats.unstack('scenario').reindex(columns=columns).fillna(0)
+            # Missing universities/topics turn the columns into floats; restore the counts
+            stats = stats.astype({(metric, name): int for metric in ['total_citations', 'paper_count']
+                                  for name in scenarios})
+            comparisons.append(stats.sort_values(('total_citations', scenarios[0]), ascending=False))
+        
+        self.status = "completed"
+        return comparisons[0], comparisons[1]
 
 class TrendAnalysisAgent:
     def __init__(self):
         self.name = "📈 Trend Analysis Agent"
         self.status = "idle"
     
+    @instrumented
     def analyze_trends(self, papers, db):
         self.status = "working"
         time.sleep(0.3)
@@ -193,6 +816,7 @@ class RecommendationAgent:
         self.name = "💡 Recommendation Agent"
         self.status = "idle"
     
+    @instrumented
     def generate_smart_recommendations(self, top_topics, uni_stats, growth_analysis):
         self.status = "working"
         time.sleep(0.2)
@@ -241,6 +865,7 @@ class ReportingAgent:
         self.name = "📝 Report Generation Agent"
         self.status = "idle"
     
+    @instrumented
     def create_visualizations(self, uni_stats, topic_stats, yearly_trends, country_stats):
         self.status = "working"
         time.sleep(0.3)
@@ -323,12 +948,22 @@ class ReportingAgent:
         return visualizations
     
     def generate_report(self, papers, uni_stats, topic_stats, recommendations, growth_analysis):
-        report = f"""
+        return self.stamp_report(
+            self.generate_report_body(papers, uni_stats, topic_stats, recommendations, growth_analysis)
+        )
+    
+    def stamp_report(self, body):
+        """Prepend the report title and generation time to a (possibly cached) body."""
+        return f"""
 # 🎓 AI Research Trends Analysis Report
 ## MENA Universities Research Output
 
 **Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
+""" + body
+    
+    @instrumented
+    def generate_report_body(self, papers, uni_stats, topic_stats, recommendations, growth_analysis):
+        report = f"""
 ---
 
 ## Executive Summary
@@ -433,12 +1068,44 @@ st.markdown('<p class="main-header">🎓 AI Research Trends in MENA Universities
 st.markdown("### Advanced Multi-Agent Analysis System")
 
 # Initialize
-db = ResearchDatabase()
+# Built once per process; the fixed default seed keeps db.version (and so the
+# result store keys) identical across reruns, restarts and workers
+@st.cache_resource(show_spinner=False)
+def load_database(seed):
+    return ResearchDatabase(seed=seed)
+
+@st.cache_resource(show_spinner=False)
+def load_result_store():
+    return ResultStore()
+
+@st.cache_resource(show_spinner=False)
+def load_scenario_catalog(seed):
+    """Scenarios share the baseline corpus and only store their deltas."""
+    base = load_database(seed)
+    catalog = ScenarioCatalog(base)
+    catalog.create_view("KAUST Doubled Output").scale_output("KAUST", 2)
+    catalog.create_view("Generative AI Citations +50%").scale_column(
+        base.papers['topic'] == "Generative AI", 'citations', 1.5
+    )
+    catalog.add_dataset("Alternate Seed", ResearchDatabase(seed=seed + 1))
+    return catalog
+
+db_seed = int(os.environ.get("RESEARCH_DB_SEED", "42"))
+db = load_database(db_seed)
+scenario_catalog = load_scenario_catalog(db_seed)
 search_agent = SearchAgent()
 analysis_agent = AnalysisAgent()
 trend_agent = TrendAnalysisAgent()
 rec_agent = RecommendationAgent()
 report_agent = ReportingAgent()
+result_store = load_result_store()
+
+if METRICS is not None:
+    METRICS.inc("app_reruns_total")
+    if os.environ.get("AGENT_METRICS_PORT"):
+        _start_metrics_server(
+            os.environ.get("AGENT_METRICS_HOST", "127.0.0.1"), int(os.environ["AGENT_METRICS_PORT"])
+        )
 
 # Sidebar
 with st.sidebar:
@@ -456,6 +1123,9 @@ with st.sidebar:
     
     show_advanced = st.checkbox("🔬 Show Advanced Analytics", value=True)
     show_visualizations = st.checkbox("📊 Show All Visualizations", value=True)
+    selected_scenarios = st.multiselect(
+        "🧪 Compare Scenarios", scenario_catalog.names(), default=["Baseline"]
+    )
     
     st.markdown("---")
     
@@ -463,9 +1133,13 @@ with st.sidebar:
     
     st.markdown("---")
     st.info("💡 **Tip:** Select multiple universities and topics for comprehensive analysis")
+    
+    store_panel = st.empty()
 
 # Main Content
 if run_btn and selected_unis and selected_topics:
+    if METRICS is not None:
+        METRICS.inc("analysis_runs_total")
     
     # Agent Status Dashboard
     st.subheader("🤖 Agent Activity Monitor")
@@ -490,10 +1164,22 @@ if run_btn and selected_unis and selected_topics:
     )
     status_containers[0].markdown(f"**{search_agent.name}**\n\n✅ Completed")
     
+    # Cached results are keyed by the query plus the database content hash
+    query_params = {
+        "universities": sorted(selected_unis),
+        "topics": sorted(selected_topics),
+        "year_range": list(year_range),
+        "min_citations": min_citations
+    }
+    
     # Agent 2: Analysis
     status_containers[1].markdown(f"**{analysis_agent.name}**\n\n🔄 Working...")
     progress_bar.progress(40)
-    uni_stats, topic_stats, yearly_trends, country_stats = analysis_agent.compute_advanced_stats(filtered_papers)
+    cached_stats = result_store.get("advanced_stats", query_params, db.version)
+    if cached_stats is None:
+        cached_stats = analysis_agent.compute_advanced_stats(filtered_papers)
+        result_store.put("advanced_stats", query_params, db.version, cached_stats)
+    uni_stats, topic_stats, yearly_trends, country_stats = cached_stats
     status_containers[1].markdown(f"**{analysis_agent.name}**\n\n✅ Completed")
     
     # Agent 3: Trends
@@ -512,9 +1198,27 @@ if run_btn and selected_unis and selected_topics:
     status_containers[4].markdown(f"**{report_agent.name}**\n\n🔄 Working...")
     progress_bar.progress(90)
     visualizations = report_agent.create_visualizations(uni_stats, topic_stats, yearly_trends, country_stats)
-    final_report = report_agent.generate_report(filtered_papers, uni_stats, topic_stats, recommendations, growth_analysis)
+    report_body = result_store.get("report", query_params, db.version)
+    if report_body is None:
+        report_body = report_agent.generate_report_body(filtered_papers, uni_stats, topic_stats, recommendations, growth_analysis)
+        result_store.put("report", query_params, db.version, report_body)
+    final_report = report_agent.stamp_report(report_body)
     status_containers[4].markdown(f"**{report_agent.name}**\n\n✅ Completed")
     
+    # Scenario comparison: one batched query and one grouped pass over all scenarios,
+    # cached under the combined version of the selected views
+    scenario_comparison = None
+    if len(selected_scenarios) > 1:
+        scenario_params = dict(query_params, scenarios=selected_scenarios)
+        scenario_version = "+".join(scenario_catalog.views[name].version for name in selected_scenarios)
+        scenario_comparison = result_store.get("scenario_comparison", scenario_params, scenario_version)
+        if scenario_comparison is None:
+            scenario_papers, _ = search_agent.filter_papers_across(
+                scenario_catalog, selected_scenarios, selected_unis, selected_topics, year_range, min_citations
+            )
+            scenario_comparison = analysis_agent.compare_scenarios(scenario_papers)
+            result_store.put("scenario_comparison", scenario_params, scenario_version, scenario_comparison)
+    
     progress_bar.progress(100)
     time.sleep(0.3)
     progress_bar.empty()
@@ -535,8 +1239,8 @@ if run_btn and selected_unis and selected_topics:
     metric_cols[4].metric("Topics", len(selected_topics), "🎯")
     
     # Tabs for different views
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
-        "📊 Overview", "🏆 Rankings", "🔥 Hot Topics", "💡 Recommendations", "📄 Full Report"
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        "📊 Overview", "🏆 Rankings", "🔥 Hot Topics", "💡 Recommendations", "📄 Full Report", "🧪 Scenarios"
     ])
     
     with tab1:
@@ -672,6 +1376,33 @@ if run_btn and selected_unis and selected_topics:
                 mime="text/csv",
                 use_container_width=True
             )
+    
+    with tab6:
+        st.subheader("🧪 Scenario Comparison")
+        
+        if scenario_comparison is None:
+            st.info("Select at least two scenarios in the sidebar to compare them side by side")
+        else:
+            uni_comparison, topic_comparison = scenario_comparison
+            
+            scenario_cols = st.columns(len(selected_scenarios))
+            for idx, name in enumerate(selected_scenarios):
+                scenario_cols[idx].metric(
+                    name,
+                    int(uni_comparison['paper_count'][name].sum()),
+                    f"{int(uni_comparison['total_citations'][name].sum()):,} citations",
+                    delta_color="off"
+                )
+            
+            st.markdown("### 🏛️ Universities: Total Citations")
+            st.dataframe(uni_comparison['total_citations'], use_container_width=True)
+            st.markdown("### 🏛️ Universities: Paper Count")
+            st.dataframe(uni_comparison['paper_count'], use_container_width=True)
+            st.markdown("### 🎯 Topics: Total Citations")
+            st.dataframe(topic_comparison['total_citations'], use_container_width=True)
+            
+            delta_kb = sum(scenario_catalog.views[name].delta_bytes for name in selected_scenarios) / 1024
+            st.caption(f"Scenario deltas: {delta_kb:.1f} KB on top of the shared corpora")
 
 else:
     # Welcome Screen
@@ -709,6 +1440,56 @@ else:
     st.subheader("📊 Sample Dataset Preview")
     st.dataframe(db.papers.head(10), use_container_width=True)
 
+# Result Store Panel (filled last so it includes this run's lookups)
+store_stats = result_store.stats()
+with store_panel.container():
+    with st.expander("🗄️ Result Store"):
+        st.metric("Hit Rate", f"{store_stats['hit_rate']:.0%}")
+        st.metric("Avg Lookup", f"{store_stats['avg_lookup_ms']:.2f} ms")
+        st.caption(f"{store_stats['entries']} entries · {store_stats['size_bytes'] / 1024:.0f} KB")
+
+# Admin Metrics Panel
+if METRICS is not None:
+    tracked_frames = {"papers": db.papers, "collaborations": db.collaborations}
+    if run_btn and selected_unis and selected_topics:
+        tracked_frames["filtered_papers"] = filtered_papers
+    for frame_name, frame in tracked_frames.items():
+        METRICS.set_gauge("dataframe_rows", len(frame), {"frame": frame_name})
+        METRICS.set_gauge("dataframe_bytes", int(frame.memory_usage(deep=True).sum()), {"frame": frame_name})
+    
+    METRICS.set_gauge("result_store_entries", store_stats['entries'])
+    METRICS.set_gauge("result_store_bytes", store_stats['size_bytes'])
+    METRICS.set_gauge("result_store_hit_rate", round(store_stats['hit_rate'], 4))
+    METRICS.set_gauge("scenario_delta_bytes", sum(v.delta_bytes for v in scenario_catalog.views.values()))
+    rss = process_rss_bytes()
+    if rss is not None:
+        METRICS.set_gauge("process_resident_memory_bytes", rss)
+    max_rss = process_max_rss_bytes()
+    if max_rss is not None:
+        METRICS.set_gauge("process_max_resident_memory_bytes", max_rss)
+    
+    metrics_text = METRICS.render()
+    if os.environ.get("AGENT_METRICS_FILE"):
+        write_metrics_file(os.environ["AGENT_METRICS_FILE"], metrics_text)
+    
+    with st.sidebar:
+        with st.expander("📟 Admin: Metrics"):
+            admin_cols = st.columns(2)
+            admin_cols[0].metric("Reruns", METRICS.counter("app_reruns_total"))
+            admin_cols[1].metric("RSS", f"{rss / 1024 ** 2:.0f} MB" if rss is not None else "n/a")
+            
+            latency = METRICS.latency_summary()
+            if latency:
+                st.dataframe(pd.DataFrame(latency), use_container_width=True, hide_index=True)
+            
+            st.download_button(
+                "📥 Download Metrics (Prometheus)",
+                data=metrics_text,
+                file_name="metrics.prom",
+                mime="text/plain",
+                use_container_width=True
+            )
+
 # Footer
 st.markdown("---")
 st.markdown("""